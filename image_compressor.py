@@ -1,67 +1,230 @@
 
+import io
 import os
 import argparse
+import math
+import struct
+import zlib
 from PIL import Image
+from PIL.PngImagePlugin import PngInfo
 from tkinter import Tk, filedialog
-from concurrent.futures import ProcessPoolExecutor
 import multiprocessing
 
-def get_file_size(file_path):
-    """Returns the file size in a human-readable format (KB or MB)."""
-    size_bytes = os.path.getsize(file_path)
+try:
+    import cv2
+    import numpy as np
+except ImportError:
+    cv2 = None
+
+try:
+    import deflate
+except ImportError:
+    deflate = None
+
+def format_size(size_bytes):
+    """Returns a byte count in a human-readable format (KB or MB)."""
     if size_bytes < 1024 * 1024:
         return f"{size_bytes / 1024:.2f} KB"
     else:
         return f"{size_bytes / (1024 * 1024):.2f} MB"
 
-def compress_image(args_tuple):
-    """Worker function to compress a single image. Designed for parallel processing."""
-    input_path, output_path, quality, use_webp, webp_method, resize_percentage, max_dimension, strip_exif, dither = args_tuple
+def report_results(results, total):
+    """Consumes worker results as they arrive. Errors are printed immediately, progress every 10
+    images, and the byte totals once at the end.
+    """
+    done = total_in = total_out = 0
+    for i, result in enumerate(results, 1):
+        if isinstance(result, str):
+            print(result)
+        elif result:
+            done += 1
+            total_in += result[0]
+            total_out += result[1]
+        if i % 10 == 0 and i < total:
+            print(f"  - {i}/{total} processed...")
+    print(f"  - Compressed {done}/{total} image(s): {format_size(total_in)} -> {format_size(total_out)}")
+
+def input_file_size(file_path):
+    """Returns the size of an input file for scheduling, or 0 if it can't be read."""
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
 
-    if not input_path or not os.path.exists(input_path):
+def read_input(input_path):
+    """Reads an input file with a single unbuffered read. Returns None if the file is missing."""
+    try:
+        with open(input_path, 'rb', buffering=0) as f:
+            return f.read()
+    except FileNotFoundError:
         print(f"Skipping missing file: {input_path}")
         return None
 
-    try:
-        original_size = get_file_size(input_path)
-        img = Image.open(input_path)
+def thumbnail_size(width, height, max_dimension):
+    """Returns the size Image.thumbnail() picks for a max_dimension square box, or None if the image
+    already fits. Mirrors Pillow's aspect-preserving rounding so --fast-path gives identical dimensions.
+    """
+    if width <= max_dimension and height <= max_dimension:
+        return None
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    aspect = width / height
+    if aspect <= 1:
+        return round_aspect(max_dimension * aspect, key=lambda n: abs(aspect - n / max_dimension)), max_dimension
+    return max_dimension, round_aspect(max_dimension / aspect, key=lambda n: 0 if n == 0 else abs(aspect - max_dimension / n))
+
+def quantize_png(img, dither):
+    """Quantizes an RGB or RGBA image to a palette no larger than its own colour count."""
+    colors = len(img.getcolors(256) or ()) or 256
+    # LIBIMAGEQUANT's perceptual search only pays off for photographic content, so flat graphics with a
+    # few colours get median cut, which keeps every colour when the palette has room for all of them.
+    # Median cut doesn't support RGBA, and fast octree would shift colours, so RGBA stays on LIBIMAGEQUANT.
+    if colors <= 64 and img.mode != 'RGBA':
+        method = Image.Quantize.MEDIANCUT
+    else:
+        method = Image.Quantize.LIBIMAGEQUANT
+    return img.quantize(colors=colors, method=method, dither=dither)
+
+def passthrough_png(img, dither):
+    """Palette images are already at most 256 colours; quantizing them again only costs time."""
+    return img
+
+def convert_and_quantize_png(img, dither):
+    """Fallback for other modes: converts to RGB first unless the image carries transparency."""
+    if 'transparency' not in img.info:
+        img = img.convert('RGB')
+    return quantize_png(img, dither)
+
+# PNG preparation per image mode. RGB goes straight to quantize, since convert('RGB') on an RGB image is a full copy.
+PNG_QUANTIZERS = {
+    'RGB': quantize_png,
+    'RGBA': quantize_png,
+    'P': passthrough_png,
+}
+
+def save_png(img, output_path, save_params):
+    """Saves a PNG. When the optional deflate (libdeflate) package is installed, Pillow writes the
+    image data uncompressed and libdeflate re-compresses it, which is both faster and smaller than
+    Pillow's zlib at optimize=True.
+    """
+    if deflate is None:
+        img.save(output_path, **save_params)
+        return
+
+    buffer = io.BytesIO()
+    img.save(buffer, 'png', **dict(save_params, optimize=False, compress_level=0))
+    png = buffer.getvalue()
+
+    # Split the file around its (consecutive) IDAT chunks and merge their payloads.
+    head = tail = None
+    idat = []
+    pos = 8
+    while pos < len(png):
+        length, chunk_type = struct.unpack('>I4s', png[pos:pos + 8])
+        end = pos + 12 + length
+        if chunk_type == b'IDAT':
+            if head is None:
+                head = png[:pos]
+            idat.append(png[pos + 8:end - 4])
+            tail = end
+        pos = end
 
-        # --- 1. Strip EXIF Data ---
-        if strip_exif and hasattr(img, 'info'):
-            img_data = list(img.getdata())
-            new_img = Image.new(img.mode, img.size)
-            new_img.putdata(img_data)
-            img = new_img
+    # Level 9 beats zlib -9 on size at a fraction of its time; 10-12 are exhaustive and much slower.
+    compressed = deflate.zlib_compress(zlib.decompress(b''.join(idat)), 9)
+    with open(output_path, 'wb') as f:
+        f.write(head)
+        f.write(struct.pack('>I', len(compressed)) + b'IDAT')
+        f.write(compressed)
+        f.write(struct.pack('>I', deflate.crc32(compressed, zlib.crc32(b'IDAT'))))
+        f.write(png[tail:])
 
-        # --- 2. Image Resizing ---
+def compress_image(args_tuple):
+    """Worker function to compress a single image. Designed for parallel processing.
+
+    Returns (original_bytes, compressed_bytes) on success, an error message on failure, or None if
+    the input is missing. Results are kept this small because each one is pickled back to the parent.
+    """
+    input_path, output_path, quality, use_webp, webp_method, resize_percentage, max_dimension, strip_exif, dither = args_tuple
+
+    try:
+        # The bytes in hand replace the separate exists/getsize stats and let Pillow decode from memory.
+        data = read_input(input_path)
+        if data is None:
+            return None
+        img = Image.open(io.BytesIO(data))
+
+        # --- 1. Image Resizing ---
         if resize_percentage:
             width, height = img.size
             new_width = int(width * resize_percentage / 100)
             new_height = int(height * resize_percentage / 100)
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            # JPEGs can be decoded directly at 1/2, 1/4 or 1/8 scale; draft() asks for no less than 2x the
+            # target so the Lanczos pass still has detail to work with. It is a no-op for other formats, and
+            # thumbnail() below already does the same.
+            if resize_percentage < 50:
+                img.draft(img.mode, (new_width * 2, new_height * 2))
+            # reducing_gap box-reduces by an integer factor first so Lanczos only filters ~2x the target
+            # size; thumbnail() below already does this by default. Image.reduce() has no 16-bit
+            # (I;16*) support, so those images resize in a single Lanczos pass as before.
+            reducing_gap = None if img.mode.startswith('I;16') else 2.0
+            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
         elif max_dimension:
             img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
 
-        # Ensure output directory exists
-        output_dir = os.path.dirname(output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        # --- 3. Smart Compression Logic ---
+        # --- 2. Smart Compression Logic ---
+        # EXIF is stripped by handing the encoders empty metadata rather than copying the pixels.
         save_params = {'optimize': True}
         if use_webp:
             save_params['quality'] = quality
             save_params['method'] = webp_method
+            if strip_exif:
+                save_params.update(exif=b"", icc_profile=None, xmp=b"")
             img.save(output_path, 'webp', **save_params)
         else:
-            if img.mode == 'RGBA' or 'transparency' in img.info:
-                img = img.quantize(colors=256, method=Image.Quantize.LIBIMAGEQUANT, dither=dither)
-            else:
-                img = img.convert('RGB').quantize(colors=256, method=Image.Quantize.LIBIMAGEQUANT, dither=dither)
-            img.save(output_path, **save_params)
+            img = PNG_QUANTIZERS.get(img.mode, convert_and_quantize_png)(img, dither)
+            if strip_exif:
+                save_params.update(pnginfo=PngInfo(), icc_profile=None)
+            save_png(img, output_path, save_params)
+
+        return len(data), os.path.getsize(output_path)
+
+    except Exception as e:
+        return f"Error compressing {os.path.basename(input_path)}: {e}"
+
+def compress_image_fast(args_tuple):
+    """OpenCV variant of compress_image for --fast-path. Decodes, resizes and encodes to WebP on
+    NumPy arrays without going through PIL objects. Returns the same results as compress_image.
+    """
+    input_path, output_path, quality, use_webp, webp_method, resize_percentage, max_dimension, strip_exif, dither = args_tuple
+
+    try:
+        data = read_input(input_path)
+        if data is None:
+            return None
+        # imdecode on the bytes we already read, rather than imread, also keeps non-ASCII paths working on Windows.
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise ValueError("unsupported or corrupt image")
+        if img.dtype != np.uint8:
+            img = (img >> 8).astype(np.uint8)
+
+        height, width = img.shape[:2]
+        new_size = None
+        if resize_percentage:
+            new_size = (int(width * resize_percentage / 100), int(height * resize_percentage / 100))
+        elif max_dimension:
+            new_size = thumbnail_size(width, height, max_dimension)
+        if new_size:
+            img = cv2.resize(img, new_size, interpolation=cv2.INTER_LANCZOS4)
 
-        compressed_size = get_file_size(output_path)
-        return f"  - Input: {os.path.basename(input_path)} ({original_size}) -> Output: {os.path.basename(output_path)} ({compressed_size})"
+        # OpenCV never writes EXIF, so strip_exif needs no extra work here.
+        ok, encoded = cv2.imencode('.webp', img, [cv2.IMWRITE_WEBP_QUALITY, quality])
+        if not ok:
+            raise ValueError("WebP encoding failed")
+        encoded.tofile(output_path)
+        return len(data), os.path.getsize(output_path)
 
     except Exception as e:
         return f"Error compressing {os.path.basename(input_path)}: {e}"
@@ -76,7 +239,7 @@ def main():
     # Compression Arguments
     parser.add_argument("-q", "--quality", type=int, default=85, help="Compression quality for WebP (1-100). Default: 85.")
     parser.add_argument("--no-webp", action="store_true", help="Disable WebP and use PNG quantization instead.")
-    parser.add_argument("--webp-method", type=int, default=4, choices=range(0, 7), help="WebP method (0-6). Higher is slower but smaller. Default: 4.")
+    parser.add_argument("--webp-method", type=int, default=4, choices=range(0, 7), help="WebP method (0-6). Higher is slower but smaller. Ignored with --fast-path. Default: 4.")
 
     # Resizing Arguments
     parser.add_argument("--resize", type=int, metavar='PCT', help="Resize image to a percentage of original size.")
@@ -85,8 +248,17 @@ def main():
     # Other Arguments
     parser.add_argument("--strip-exif", action="store_true", help="Remove EXIF data from images.")
     parser.add_argument("--no-parallel", action="store_true", help="Disable parallel processing for directories.")
+    parser.add_argument("--fast-path", action="store_true", help="Decode, resize and encode with OpenCV instead of Pillow (WebP only, ignores --webp-method, needs opencv-python).")
 
     args = parser.parse_args()
+    if args.fast_path:
+        if args.no_webp:
+            parser.error("--fast-path only supports WebP output.")
+        if cv2 is None:
+            parser.error("--fast-path requires OpenCV and NumPy (pip install opencv-python).")
+        if args.webp_method != parser.get_default("webp_method"):
+            print("Warning: --webp-method has no effect with --fast-path; OpenCV uses its own WebP settings.")
+    worker = compress_image_fast if args.fast_path else compress_image
 
     # --- Handle GUI File Pickers ---
     input_path = args.input
@@ -128,16 +300,17 @@ def main():
             print("No output location chosen. Exiting."); return
 
     # --- Prepare and Execute Compression ---
+    # Output directories are created here, once, so the workers never have to check for them.
     tasks = []
     if os.path.isdir(input_path):
-        if not os.path.exists(output_path):
-            os.makedirs(output_path)
+        os.makedirs(output_path, exist_ok=True)
         for filename in os.listdir(input_path):
             if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.ppm')):
                 in_file = os.path.join(input_path, filename)
                 out_file = os.path.join(output_path, os.path.splitext(filename)[0] + ('.webp' if not args.no_webp else '.png'))
                 tasks.append((in_file, out_file, args.quality, not args.no_webp, args.webp_method, args.resize, args.max_dim, args.strip_exif, Image.Dither.NONE))
     else:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
         tasks.append((input_path, output_path, args.quality, not args.no_webp, args.webp_method, args.resize, args.max_dim, args.strip_exif, Image.Dither.NONE))
 
     print(f"Starting compression for {len(tasks)} image(s)...")
@@ -145,17 +318,14 @@ def main():
         # Parallel Processing
         num_workers = multiprocessing.cpu_count()
         print(f"Using {num_workers} CPU cores for parallel processing...")
-        with ProcessPoolExecutor(max_workers=num_workers) as executor:
-            results = executor.map(compress_image, tasks)
-            for result in results:
-                if result:
-                    print(result)
+        # Largest files first, so a big image picked up last can't leave the other cores idle.
+        tasks.sort(key=lambda task: input_file_size(task[0]), reverse=True)
+        chunksize = max(1, len(tasks) // (num_workers * 4))
+        with multiprocessing.Pool(num_workers) as pool:
+            report_results(pool.imap_unordered(worker, tasks, chunksize=chunksize), len(tasks))
     else:
         # Sequential Processing
-        for task in tasks:
-            result = compress_image(task)
-            if result:
-                print(result)
+        report_results(map(worker, tasks), len(tasks))
 
     print("\nCompression complete.")
 
@@ -1,21 +1,31 @@
+import io
 import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
-from concurrent.futures import ProcessPoolExecutor
 import multiprocessing
 from PIL import Image
+from PIL.PngImagePlugin import PngInfo
 
 # --- Core Compression Logic (adapted from the CLI script) ---
 
-def get_file_size(file_path):
-    size_bytes = os.path.getsize(file_path)
-    if size_bytes == 0: return "0 B"
-    size_name = ("B", "KB", "MB", "GB")
-    i = int(math.floor(math.log(size_bytes, 1024)))
-    p = math.pow(1024, i)
-    s = round(size_bytes / p, 2)
-    return f"{s} {size_name[i]}"
+SIZE_NAMES = ("B", "KB", "MB", "GB")
+
+def format_size(size_bytes):
+    # Every 10 bits is one 1024x unit step, so bit_length() picks the unit without log/pow.
+    i = min(max(size_bytes.bit_length() - 1, 0) // 10, len(SIZE_NAMES) - 1)
+    s = round(size_bytes / (1 << (10 * i)), 2)
+    return f"{s} {SIZE_NAMES[i]}"
+
+def input_file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+def init_worker():
+    # Load every Pillow plugin (WebP included) once per worker instead of on its first save.
+    Image.init()
 
 def compress_image_worker(args_tuple):
     input_path, output_dir, quality, use_webp, webp_method, resize_percentage, max_dimension, strip_exif = args_tuple
@@ -25,32 +35,39 @@ def compress_image_worker(args_tuple):
     output_path = os.path.join(output_dir, os.path.splitext(base_name)[0] + output_ext)
 
     try:
-        img = Image.open(input_path)
-
-        if strip_exif and hasattr(img, 'info'):
-            img_data = list(img.getdata())
-            new_img = Image.new(img.mode, img.size)
-            new_img.putdata(img_data)
-            img = new_img
+        with open(input_path, 'rb', buffering=0) as f:
+            data = f.read()
+        img = Image.open(io.BytesIO(data))
 
         if resize_percentage and resize_percentage < 100:
             w, h = img.size
             nw, nh = int(w * resize_percentage / 100), int(h * resize_percentage / 100)
-            img = img.resize((nw, nh), Image.Resampling.LANCZOS)
+            if resize_percentage < 50:
+                img.draft(img.mode, (nw * 2, nh * 2))
+            reducing_gap = None if img.mode.startswith('I;16') else 2.0
+            img = img.resize((nw, nh), Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
         elif max_dimension:
             img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
 
         save_params = {'optimize': True}
         if use_webp:
             save_params.update({'quality': quality, 'method': webp_method})
+            if strip_exif:
+                save_params.update({'exif': b"", 'icc_profile': None, 'xmp': b""})
             img.save(output_path, 'webp', **save_params)
         else:
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            img = img.quantize(colors=256, method=Image.Quantize.LIBIMAGEQUANT, dither=Image.Dither.NONE)
+            if img.mode != 'P':
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+                colors = len(img.getcolors(256) or ()) or 256
+                method = Image.Quantize.MEDIANCUT if colors <= 64 else Image.Quantize.LIBIMAGEQUANT
+                img = img.quantize(colors=colors, method=method, dither=Image.Dither.NONE)
+            if strip_exif:
+                save_params.update({'pnginfo': PngInfo(), 'icc_profile': None})
             img.save(output_path, 'png', **save_params)
             
-        return f"SUCCESS: {base_name} -> {os.path.basename(output_path)}"
+        # Just the two sizes: this tuple is what gets pickled back to the GUI process.
+        return len(data), os.path.getsize(output_path)
     except Exception as e:
         return f"ERROR: Compressing {base_name}: {e}"
 
@@ -64,6 +81,12 @@ class ImageCompressorApp(tk.Tk):
 
         self.file_list = []
 
+        # One worker pool for the lifetime of the window, so repeated runs don't pay process startup again.
+        self.num_workers = multiprocessing.cpu_count()
+        self.pool = multiprocessing.get_context("spawn").Pool(self.num_workers, initializer=init_worker)
+        self.closing = False
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # --- Main Layout ---
         main_frame = ttk.Frame(self, padding="10")
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -82,6 +105,23 @@ class ImageCompressorApp(tk.Tk):
         # --- Right Frame: Controls ---
         self.setup_controls_ui(right_frame)
 
+    def on_close(self):
+        # Tell a running compression thread to stop posting before the pool and widgets go away.
+        # If it is still waiting on the terminated pool it never wakes up; it is a daemon thread.
+        self.closing = True
+        self.pool.terminate()
+        self.destroy()
+
+    def post(self, callback, *args):
+        # Schedules a Tk update from the compression thread; dropped once the window is closing.
+        if self.closing:
+            return
+        try:
+            self.after(0, callback, *args)
+        except (RuntimeError, tk.TclError):
+            # Lost the race with on_close(): the app was destroyed between the check and the call.
+            pass
+
     def setup_file_list_ui(self, parent):
         frame = ttk.LabelFrame(parent, text="Files to Compress")
         frame.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
@@ -200,31 +240,51 @@ class ImageCompressorApp(tk.Tk):
         if not output_dir:
             return
 
-        # Start the compression in a new thread to avoid freezing the GUI
-        thread = threading.Thread(target=self.run_compression, args=(output_dir,))
-        thread.daemon = True
-        thread.start()
+        # Tk variables are read here, on the main thread; the worker thread only sees plain data.
+        resize_pct = self.resize_pct_var.get() if self.resize_mode.get() == 'pct' else None
+        max_dim = self.max_dim_var.get() if self.resize_mode.get() == 'dim' else None
+        tasks = [(f, output_dir, self.quality.get(), self.use_webp.get(), self.webp_method.get(), resize_pct, max_dim, self.strip_exif.get()) for f in self.file_list]
 
-    def run_compression(self, output_dir):
         self.progress['value'] = 0
-        self.progress['maximum'] = len(self.file_list)
+        self.progress['maximum'] = len(tasks)
         self.log("Starting compression...")
 
-        resize_pct = self.resize_pct_var.get() if self.resize_mode.get() == 'pct' else None
-        max_dim = self.max_dim_var.get() if self.resize_mode.get() == 'dim' else None
-
-        tasks = [(f, output_dir, self.quality.get(), self.use_webp.get(), self.webp_method.get(), resize_pct, max_dim, self.strip_exif.get()) for f in self.file_list]
+        # Start the compression in a new thread to avoid freezing the GUI
+        thread = threading.Thread(target=self.run_compression, args=(tasks,))
+        thread.daemon = True
+        thread.start()
 
-        with ProcessPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-            for i, result in enumerate(executor.map(compress_image_worker, tasks)):
-                self.log(result)
-                self.progress['value'] = i + 1
-                self.update_idletasks()
-        
+    def run_compression(self, tasks):
+        # Runs off the main thread: Tk is not thread-safe, so every widget update goes through post().
+        # Schedule the biggest files first; missing files sort last and error out in the worker.
+        tasks.sort(key=lambda task: input_file_size(task[0]), reverse=True)
+
+        chunksize = max(1, len(tasks) // (self.num_workers * 4))
+        done = total_in = total_out = 0
+        for i, result in enumerate(self.pool.imap_unordered(compress_image_worker, tasks, chunksize=chunksize), 1):
+            if self.closing:
+                return
+            if isinstance(result, str):
+                self.post(self.log, result)
+            else:
+                done += 1
+                total_in += result[0]
+                total_out += result[1]
+            # Only every 10th result touches the log widget; large batches would otherwise flood the Tk event queue.
+            if i % 10 == 0 or i == len(tasks):
+                self.post(self.log, f"Processed {i}/{len(tasks)}: {done} compressed, {format_size(total_in)} -> {format_size(total_out)}")
+            # An absolute value, not progress.step(): Tk's step wraps to 0 once it reaches the maximum.
+            self.post(self.set_progress, i)
+
+        self.post(self.finish_compression)
+
+    def set_progress(self, value):
+        self.progress['value'] = value
+
+    def finish_compression(self):
         self.log("--- Compression Complete ---")
         messagebox.showinfo("Success", "All images have been processed.")
 
 if __name__ == "__main__":
-    import math
     app = ImageCompressorApp()
     app.mainloop()